@@ -19,14 +19,21 @@
 # FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
 # DEALINGS IN THE SOFTWARE.
 
-# pip install pandas
+# pip install numpy
+# pip install pyarrow
 
 import asyncio
+from collections import deque
+from datetime import datetime, timezone
 import os
 import omni.client
 from pxr import Usd, Sdf, Gf
 from pathlib import Path
-import pandas as pd
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
+import pyarrow.parquet as pq
 import time
 from omni.live import LiveEditSession, LiveCube, getUserNameFromToken
 
@@ -37,11 +44,38 @@ if OMNI_USER.lower() == "omniverse":
 elif OMNI_USER.lower() == "$omni-api-token":
     OMNI_USER = getUserNameFromToken(os.environ.get("OMNI_PASS"))
 
+# every omni.client log message goes through log_handler, so only warnings and above are logged unless asked for
+OMNI_LOG_LEVELS = ["DEBUG", "VERBOSE", "INFO", "WARNING", "ERROR"]
+OMNI_LOG_LEVEL_NAME = (os.environ.get("OMNI_LOG_LEVEL") or "WARNING").upper()
+if OMNI_LOG_LEVEL_NAME not in OMNI_LOG_LEVELS:
+    raise Exception(f"Unknown OMNI_LOG_LEVEL '{OMNI_LOG_LEVEL_NAME}', expected one of: {', '.join(OMNI_LOG_LEVELS)}.")
+OMNI_LOG_LEVEL = getattr(omni.client.LogLevel, OMNI_LOG_LEVEL_NAME)
+
 BASE_FOLDER = "omniverse://" + OMNI_HOST + "/Users/" + OMNI_USER + "/iot-samples"
 SCRIPT_DIR = os.path.dirname(os.path.realpath(__file__))
 CONTENT_DIR = Path(SCRIPT_DIR).resolve().parents[1].joinpath("content")
 
-messages = []
+# keep only the most recent log messages so long playbacks do not grow without bound
+messages = deque(maxlen=10000)
+
+# the data is streamed in blocks so memory stays constant regardless of the length of the recording
+IOT_CSV_BLOCK_SIZE = 1 << 22
+IOT_CSV_READ_OPTIONS = pacsv.ReadOptions(use_threads=True, block_size=IOT_CSV_BLOCK_SIZE)
+
+# only the three columns used by the connector are parsed. TimeStamp must be ISO 8601 with a zone offset
+# (e.g. 2023-09-19 20:35:26.123+00:00), it is read as UTC with any sub-second precision and dropped to
+# seconds on playback
+IOT_DATA_SCHEMA = pa.schema([("TimeStamp", pa.timestamp("ns", tz="UTC")), ("Id", pa.string()), ("Value", pa.float64())])
+IOT_CSV_CONVERT_OPTIONS = pacsv.ConvertOptions(
+    column_types=dict(zip(IOT_DATA_SCHEMA.names, IOT_DATA_SCHEMA.types)),
+    include_columns=IOT_DATA_SCHEMA.names,
+)
+
+# the parsed CSV is cached as parquet next to it and played back in batches of IOT_PARQUET_BATCH_SIZE rows
+IOT_PARQUET_BATCH_SIZE = 1 << 16
+
+# paths of the attributes created by initialize_device_prim, keyed by the CSV Id
+PATH_CACHE = {}
 
 
 def log_handler(thread, component, level, message):
@@ -49,7 +83,48 @@ def log_handler(thread, component, level, message):
     messages.append((thread, component, level, message))
 
 
-def initialize_device_prim(live_layer, iot_topic):
+def is_iot_parquet_current(parquet_path, csv_path):
+    # the cache is only used if it is newer than the CSV and was written with the schema the app now expects
+    if not os.path.exists(parquet_path) or os.path.getmtime(parquet_path) < os.path.getmtime(csv_path):
+        return False
+    try:
+        return pq.read_schema(parquet_path).equals(IOT_DATA_SCHEMA, check_metadata=False)
+    except pa.ArrowInvalid:
+        return False
+
+
+def ensure_iot_parquet(iot_topic):
+    # we assume that the file contains the data for single device
+    IOT_TOPIC_DATA = f"{CONTENT_DIR}/{iot_topic}_iot_data.csv"
+    IOT_TOPIC_PARQUET = f"{IOT_TOPIC_DATA}.parquet"
+    if is_iot_parquet_current(IOT_TOPIC_PARQUET, IOT_TOPIC_DATA):
+        return IOT_TOPIC_PARQUET
+
+    # convert the CSV block by block, writing to a temporary file so an interrupted run does not leave a partial cache
+    reader = pacsv.open_csv(IOT_TOPIC_DATA, read_options=IOT_CSV_READ_OPTIONS, convert_options=IOT_CSV_CONVERT_OPTIONS)
+    # parquet 2.6 keeps the ns timestamps, older format versions would coerce them
+    with pq.ParquetWriter(f"{IOT_TOPIC_PARQUET}.tmp", reader.schema, version="2.6") as writer:
+        for batch in reader:
+            writer.write_table(pa.Table.from_batches([batch]))
+    os.replace(f"{IOT_TOPIC_PARQUET}.tmp", IOT_TOPIC_PARQUET)
+    return IOT_TOPIC_PARQUET
+
+
+def open_iot_data(iot_topic, columns=None):
+    return pq.ParquetFile(ensure_iot_parquet(iot_topic)).iter_batches(
+        batch_size=IOT_PARQUET_BATCH_SIZE, columns=columns
+    )
+
+
+def load_iot_ids(iot_topic):
+    # infer the unique data points in the data, only the Id column is read
+    ids = {}
+    for batch in open_iot_data(iot_topic, ["Id"]):
+        ids.update(dict.fromkeys(pc.unique(batch.column(0)).drop_null().to_pylist()))
+    return list(ids)
+
+
+def initialize_device_prim(live_layer, iot_topic, ids):
     iot_root = live_layer.GetPrimAtPath("/iot")
     if not iot_root:
         iot_root = Sdf.PrimSpec(live_layer, "iot", Sdf.SpecifierDef, "IoT Root")
@@ -64,26 +139,24 @@ def initialize_device_prim(live_layer, iot_topic):
     for attrib in iot_spec.attributes:
         iot_spec.RemoveProperty(attrib)
 
-    IOT_TOPIC_DATA = f"{CONTENT_DIR}/{iot_topic}_iot_data.csv"
-    data = pd.read_csv(IOT_TOPIC_DATA)
-    data.head()
-
     # create all the IoT attributes that will be written
+    PATH_CACHE.clear()
     attr = Sdf.AttributeSpec(iot_spec, "_ts", Sdf.ValueTypeNames.Double)
     if not attr:
-        raise Exception(f"Could not define the attribute: {attrName}")
+        raise Exception("Could not define the attribute: _ts")
+    PATH_CACHE["_ts"] = attr.path
 
-    # infer the unique data points in the CSV.
+    # the data points are inferred from the CSV.
     # The values may be known in advance and can be hard coded
-    grouped = data.groupby("Id")
-    for attrName, group in grouped:
+    for attrName in ids:
         attr = Sdf.AttributeSpec(iot_spec, attrName, Sdf.ValueTypeNames.Double)
         if not attr:
             raise Exception(f"Could not define the attribute: {attrName}")
+        PATH_CACHE[attrName] = attr.path
 
 
-async def initialize_async(iot_topic):
-    # copy a the Conveyor Belt to the target nucleus server
+async def initialize_async(iot_topic, ids, *, overwrite=False):
+    # copy a the Conveyor Belt to the target nucleus server, replacing an existing copy only if asked to
     stage_name = f"ConveyorBelt_{iot_topic}"
     local_folder = f"file:{CONTENT_DIR}/{stage_name}"
     stage_folder = f"{BASE_FOLDER}/{stage_name}"
@@ -91,23 +164,25 @@ async def initialize_async(iot_topic):
     result = await omni.client.copy_async(
         local_folder,
         stage_folder,
-        behavior=omni.client.CopyBehavior.ERROR_IF_EXISTS,
+        behavior=omni.client.CopyBehavior.OVERWRITE if overwrite else omni.client.CopyBehavior.ERROR_IF_EXISTS,
         message="Copy Conveyor Belt",
     )
 
-    stage = Usd.Stage.Open(stage_url)
+    # once the copy is done, open the stage on a worker thread while the live session is resolved
+    live_session = LiveEditSession(stage_url)
+    stage, live_layer = await asyncio.gather(
+        asyncio.to_thread(Usd.Stage.Open, stage_url),
+        live_session.ensure_exists(),
+    )
     if not stage:
         raise Exception(f"Could load the stage {stage_url}.")
 
-    live_session = LiveEditSession(stage_url)
-    live_layer = await live_session.ensure_exists()
-
     session_layer = stage.GetSessionLayer()
     session_layer.subLayerPaths.append(live_layer.identifier)
 
     # set the live layer as the edit target
     stage.SetEditTarget(live_layer)
-    initialize_device_prim(live_layer, iot_topic)
+    initialize_device_prim(live_layer, iot_topic, ids)
 
     # place the cube on the conveyor
     live_cube = LiveCube(stage)
@@ -117,54 +192,139 @@ async def initialize_async(iot_topic):
     return stage, live_layer
 
 
-def write_to_live(live_layer, iot_topic, group, ts):
+def write_to_live(live_layer, ts_path, paths, timestamp, codes, values, ts):
     # write the iot values to the usd prim attributes
-    print(group.iloc[0]["TimeStamp"])
-    ts_attribute = live_layer.GetAttributeAtPath(f"/iot/{iot_topic}._ts")
-    ts_attribute.default = ts
-    with Sdf.ChangeBlock():
-        for index, row in group.iterrows():
-            id = row["Id"]
-            value = row["Value"]
-            attr = live_layer.GetAttributeAtPath(f"/iot/{iot_topic}.{id}")
-            if not attr:
-                raise Exception(f"Could not find attribute /iot/{iot_topic}.{id}.")
-            attr.default = value
-    omni.client.live_process()
+    print(timestamp.astype(datetime).replace(tzinfo=timezone.utc))
+    # set the default field directly on the layer rather than through the spec wrappers
+    live_layer.SetField(ts_path, "default", ts)
+    for path, value in zip(paths[codes].tolist(), values.tolist()):
+        live_layer.SetField(path, "default", value)
 
 
-def run(stage, live_layer, iot_topic):
-    # we assume that the file contains the data for single device
-    IOT_TOPIC_DATA = f"{CONTENT_DIR}/{iot_topic}_iot_data.csv"
-    data = pd.read_csv(IOT_TOPIC_DATA)
-    data.head()
+def resolve_id_codes(iot_topic, ids, id_codes):
+    # factorize the Ids of a block so that playback indexes the attribute paths by integer code
+    encoded = ids.combine_chunks().dictionary_encode()
+    if encoded.null_count:
+        raise Exception(f"Found IoT data without an Id for /iot/{iot_topic}.")
+
+    lookup = []
+    for id in encoded.dictionary.to_pylist():
+        code = id_codes.get(id)
+        if code is None:
+            raise Exception(f"Could not find attribute /iot/{iot_topic}.{id}.")
+        lookup.append(code)
+    return np.array(lookup, dtype=np.int64)[encoded.indices.to_numpy()]
+
+
+def read_iot_chunks(iot_topic, id_codes):
+    # stream the data and yield the timestamps, Id codes and values of whole timesteps.
+    # the recording must be in time order, so only the last timestep of a block can
+    # continue into the next one and it is carried over rather than played in two parts.
+    pending = None
+    last_time = None
+    for batch in open_iot_data(iot_topic):
+        # rows without a TimeStamp cannot be scheduled and are skipped
+        block = pa.Table.from_batches([batch])
+        block = block.filter(pc.is_valid(block.column("TimeStamp")))
+        if block.num_rows == 0:
+            continue
+
+        # drop the sub-second part and sort by time, keeping the file order within a timestep
+        timestamps = block.column("TimeStamp").to_numpy().astype("datetime64[s]")
+        if last_time is not None and timestamps.min() <= last_time:
+            raise Exception(
+                f"IoT data for /iot/{iot_topic} is not in time order: {timestamps.min()} appears after {last_time}."
+            )
+        codes = resolve_id_codes(iot_topic, block.column("Id"), id_codes)
+        values = block.column("Value").to_numpy()
+        if pending is not None:
+            timestamps, codes, values = (np.concatenate(arrays) for arrays in zip(pending, (timestamps, codes, values)))
 
-    # Converting to DateTime Format and drop ms
-    data["TimeStamp"] = pd.to_datetime(data["TimeStamp"])
-    data["TimeStamp"] = data["TimeStamp"].dt.floor("s")
+        order = np.argsort(timestamps, kind="stable")
+        timestamps, codes, values = timestamps[order], codes[order], values[order]
 
-    data.set_index("TimeStamp")
-    start_time = data.min()["TimeStamp"]
-    last_time = start_time
-    grouped = data.groupby("TimeStamp")
+        split = np.searchsorted(timestamps, timestamps[-1], side="left")
+        pending = (timestamps[split:], codes[split:], values[split:])
+        if split > 0:
+            last_time = timestamps[split - 1]
+            yield timestamps[:split], codes[:split], values[:split]
 
-    # play back the data in real-time
-    for next_time, group in grouped:
-        diff = (next_time - last_time).total_seconds()
-        if diff > 0:
-            time.sleep(diff)
-        write_to_live(live_layer, iot_topic, group, (next_time - start_time).total_seconds())
-        last_time = next_time
+    if pending is not None:
+        yield pending
+
+
+async def flush_live_periodically(interval):
+    # push pending live layer changes on a fixed cadence, independent of the playback rate
+    while True:
+        await asyncio.sleep(interval)
+        omni.client.live_process()
+
+
+async def run_async(stage, live_layer, iot_topic, batch=4, flush_interval=0.05):
+    paths = np.empty(len(PATH_CACHE), dtype=object)
+    paths[:] = list(PATH_CACHE.values())
+    id_codes = {id: code for code, id in enumerate(PATH_CACHE)}
+    ts_path = paths[id_codes["_ts"]]
+
+    # play back the data in real-time, each timestep is scheduled against the
+    # start of playback so the time spent writing does not accumulate as drift
+    flush_task = asyncio.create_task(flush_live_periodically(flush_interval))
+    # read and decode the next block on a worker thread while the current one is played back
+    chunks = read_iot_chunks(iot_topic, id_codes)
+    next_chunk = asyncio.ensure_future(asyncio.to_thread(next, chunks, None))
+    try:
+        start_time = None
+        while (chunk := await next_chunk) is not None:
+            next_chunk = asyncio.ensure_future(asyncio.to_thread(next, chunks, None))
+            timestamps, codes, values = chunk
+
+            # the timestamps are sorted, so each unique value starts a contiguous slice
+            unique_times, starts = np.unique(timestamps, return_index=True)
+            ends = np.append(starts[1:], len(timestamps))
+            if start_time is None:
+                start_time = unique_times[0]
+                t0 = time.monotonic()
+            offsets = (unique_times - start_time) / np.timedelta64(1, "s")
+
+            step = 0
+            while step < len(unique_times):
+                # always yield to the loop, even when behind, so that the flush task gets to run
+                await asyncio.sleep(max(0, t0 + offsets[step] - time.monotonic()))
+                if flush_task.done():
+                    # the flush task only ends on failure, surface it rather than writing with nothing flushed
+                    flush_task.result()
+
+                # if playback has fallen behind, coalesce up to `batch` timesteps that are
+                # already due into a single change block
+                last_step = min(step + batch, len(unique_times))
+                due = np.searchsorted(offsets[step + 1 : last_step], time.monotonic() - t0, side="right")
+                with Sdf.ChangeBlock():
+                    for i in range(step, step + 1 + due):
+                        start, end = starts[i], ends[i]
+                        ts = float(offsets[i])
+                        write_to_live(
+                            live_layer, ts_path, paths, unique_times[i], codes[start:end], values[start:end], ts
+                        )
+                step += 1 + due
+    finally:
+        next_chunk.cancel()
+        flush_task.cancel()
+        try:
+            await flush_task
+        except asyncio.CancelledError:
+            pass
+        omni.client.live_process()
 
 
 if __name__ == "__main__":
     IOT_TOPIC = "A08_PR_NVD_01"
     omni.client.initialize()
-    omni.client.set_log_level(omni.client.LogLevel.DEBUG)
+    omni.client.set_log_level(OMNI_LOG_LEVEL)
     omni.client.set_log_callback(log_handler)
     try:
-        stage, live_layer = asyncio.run(initialize_async(IOT_TOPIC))
-        run(stage, live_layer, IOT_TOPIC)
+        ids = load_iot_ids(IOT_TOPIC)
+        stage, live_layer = asyncio.run(initialize_async(IOT_TOPIC, ids))
+        asyncio.run(run_async(stage, live_layer, IOT_TOPIC))
     except:
         print("---- LOG MESSAGES ---")
         print(*messages, sep="\n")
@@ -23,6 +23,7 @@
 # pip install paho-mqtt
 
 import asyncio
+from collections import deque
 import os
 import omni.client
 from pxr import Usd, Sdf, Gf
@@ -41,11 +42,19 @@ if OMNI_USER.lower() == "omniverse":
 elif OMNI_USER.lower() == "$omni-api-token":
     OMNI_USER = getUserNameFromToken(os.environ.get("OMNI_PASS"))
 
+# every omni.client log message goes through log_handler, so only warnings and above are logged unless asked for
+OMNI_LOG_LEVELS = ["DEBUG", "VERBOSE", "INFO", "WARNING", "ERROR"]
+OMNI_LOG_LEVEL_NAME = (os.environ.get("OMNI_LOG_LEVEL") or "WARNING").upper()
+if OMNI_LOG_LEVEL_NAME not in OMNI_LOG_LEVELS:
+    raise Exception(f"Unknown OMNI_LOG_LEVEL '{OMNI_LOG_LEVEL_NAME}', expected one of: {', '.join(OMNI_LOG_LEVELS)}.")
+OMNI_LOG_LEVEL = getattr(omni.client.LogLevel, OMNI_LOG_LEVEL_NAME)
+
 BASE_FOLDER = "omniverse://" + OMNI_HOST + "/Users/" + OMNI_USER + "/iot-samples"
 SCRIPT_DIR = os.path.dirname(os.path.realpath(__file__))
 CONTENT_DIR = Path(SCRIPT_DIR).resolve().parents[1].joinpath("content")
 
-messages = []
+# keep only the most recent log messages so long playbacks do not grow without bound
+messages = deque(maxlen=10000)
 
 
 def log_handler(thread, component, level, message):
@@ -67,7 +76,6 @@ def initialize_device_prim(live_layer, iot_topic):
 
     IOT_TOPIC_DATA = f"{CONTENT_DIR}/{iot_topic}_iot_data.csv"
     data = pd.read_csv(IOT_TOPIC_DATA)
-    data.head()
 
     # create all the IoT attributes that will be written
     attr = Sdf.AttributeSpec(iot_spec, "_ts", Sdf.ValueTypeNames.Double)
@@ -180,11 +188,10 @@ def run(stage, live_layer, iot_topic):
     # we assume that the file contains the data for single device
     IOT_TOPIC_DATA = f"{CONTENT_DIR}/{iot_topic}_iot_data.csv"
     data = pd.read_csv(IOT_TOPIC_DATA)
-    data.head()
 
-    # Converting to DateTime Format and drop ms
-    data["TimeStamp"] = pd.to_datetime(data["TimeStamp"])
-    data["TimeStamp"] = data["TimeStamp"].dt.floor("s")
+    # Converting to DateTime Format and drop ms, the timestamps are ISO 8601 so
+    # the format is given rather than inferred and the cast to seconds drops the ms
+    data["TimeStamp"] = pd.to_datetime(data["TimeStamp"], format="ISO8601", utc=True).astype("datetime64[s, UTC]")
 
     data.set_index("TimeStamp")
     start_time = data.min()["TimeStamp"]
@@ -207,7 +214,7 @@ def run(stage, live_layer, iot_topic):
 if __name__ == "__main__":
     IOT_TOPIC = "A08_PR_NVD_01"
     omni.client.initialize()
-    omni.client.set_log_level(omni.client.LogLevel.DEBUG)
+    omni.client.set_log_level(OMNI_LOG_LEVEL)
     omni.client.set_log_callback(log_handler)
     try:
         stage, live_layer = asyncio.run(initialize_async(IOT_TOPIC))
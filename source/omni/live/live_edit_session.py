@@ -43,7 +43,7 @@ class LiveEditSession:
 
         # create new session
         # first create the toml file
-        self._write_session_toml()
+        await self._write_session_toml()
         return self._ensure_live_layer()
 
     def _ensure_live_layer(self):
@@ -77,7 +77,7 @@ class LiveEditSession:
 
         return f"{os.path.dirname(self.omni_url.path)}/.live/{stage_file_name}.live"
 
-    def _write_session_toml(self):
+    async def _write_session_toml(self):
         """
         writes the session toml to Nucleus
             OWNER_KEY = "user_name"
@@ -90,7 +90,7 @@ class LiveEditSession:
 
         toml_string = "".join([f'{key} = "{value}"\n' for (key, value) in session_config.items()])
 
-        result = omni.client.write_file(self.toml_url, self._toml_bytes(toml_string))
+        result = await omni.client.write_file_async(self.toml_url, self._toml_bytes(toml_string))
 
         if result != omni.client.Result.OK:
             raise NucleusClientError(
@@ -23,6 +23,7 @@
 # pip install pandas
 
 import asyncio
+from collections import deque
 import os
 import omni.client
 from pxr import Usd, Sdf
@@ -37,11 +38,19 @@ if OMNI_USER.lower() == "omniverse":
 elif OMNI_USER.lower() == "$omni-api-token":
     OMNI_USER = getUserNameFromToken(os.environ.get("OMNI_PASS"))
 
+# every omni.client log message goes through log_handler, so only warnings and above are logged unless asked for
+OMNI_LOG_LEVELS = ["DEBUG", "VERBOSE", "INFO", "WARNING", "ERROR"]
+OMNI_LOG_LEVEL_NAME = (os.environ.get("OMNI_LOG_LEVEL") or "WARNING").upper()
+if OMNI_LOG_LEVEL_NAME not in OMNI_LOG_LEVELS:
+    raise Exception(f"Unknown OMNI_LOG_LEVEL '{OMNI_LOG_LEVEL_NAME}', expected one of: {', '.join(OMNI_LOG_LEVELS)}.")
+OMNI_LOG_LEVEL = getattr(omni.client.LogLevel, OMNI_LOG_LEVEL_NAME)
+
 BASE_FOLDER = "omniverse://" + OMNI_HOST + "/Users/" + OMNI_USER + "/iot-samples"
 SCRIPT_DIR = os.path.dirname(os.path.realpath(__file__))
 CONTENT_DIR = Path(SCRIPT_DIR).resolve().parents[1].joinpath("content")
 
-messages = []
+# keep only the most recent log messages so long playbacks do not grow without bound
+messages = deque(maxlen=10000)
 
 
 def log_handler(thread, component, level, message):
@@ -94,7 +103,7 @@ def run(stage, live_layer):
 
 if __name__ == "__main__":
     omni.client.initialize()
-    omni.client.set_log_level(omni.client.LogLevel.DEBUG)
+    omni.client.set_log_level(OMNI_LOG_LEVEL)
     omni.client.set_log_callback(log_handler)
     try:
         stage, live_layer = asyncio.run(initialize_async())